@@ -0,0 +1,88 @@
+"""Bytes on the wire and page-load latency, before and after HTTP optimisation.
+
+"Before" is the original handlers (render the page on every request, plain
+JSON); "after" is web_app as shipped. /chat uses a canned answer so only
+the HTTP layer is measured. Latency is server time plus the time to push the
+body over a slow mobile link.
+
+    python bench_http.py --requests 500 --link-kbps 400 --rtt-ms 300
+"""
+import argparse
+import time
+
+from flask import Flask, jsonify, render_template_string
+
+import web_app
+
+SAMPLE_ANSWER = (
+    "I'm so sorry you're going through this, and it took real courage to reach out. "
+    "Under the Protection from Harassment Act 1997, a course of conduct that amounts to "
+    "harassment is an offence, and you can also apply to the court for an injunction. "
+    "If you ever feel in immediate danger, please call 999. You can also talk to the "
+    "National Domestic Violence Helpline on 0808 2000 247 at any time, day or night. "
+) * 4
+
+
+class CannedChain:
+    def invoke(self, inputs):
+        return {"input": inputs["input"], "context": [], "answer": SAMPLE_ANSWER, "degraded": False}
+
+
+def baseline_app():
+    app = Flask("baseline")
+
+    @app.route('/')
+    def home():
+        return render_template_string(web_app.HTML_TEMPLATE)
+
+    @app.route('/chat', methods=['POST'])
+    def chat():
+        return jsonify({"response": SAMPLE_ANSWER, "status": "success"})
+
+    return app
+
+
+def measure(client, method, path, n, headers, json=None):
+    """Return (median server ms, body bytes on the wire, status) over n requests"""
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        response = client.open(path, method=method, headers=headers, json=json)
+        body = response.get_data()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], len(body), response.status_code
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--link-kbps", type=float, default=400, help="downlink speed of the simulated client")
+    parser.add_argument("--rtt-ms", type=float, default=300)
+    args = parser.parse_args()
+
+    web_app.rag_chain = CannedChain()
+    before = baseline_app().test_client()
+    after = web_app.app.test_client()
+
+    browser = {"Accept-Encoding": "gzip, deflate, br"}
+    etag = after.get("/", headers=browser).headers["ETag"]
+    chat = {"message": "Someone keeps following me home, what can I do?"}
+
+    cases = [
+        ("page, first visit", before, after, "GET", "/", browser, browser, None),
+        ("page, repeat visit", before, after, "GET", "/", browser, dict(browser, **{"If-None-Match": etag}), None),
+        ("/chat answer", before, after, "POST", "/chat", browser, browser, chat),
+    ]
+
+    print(f"{'case':<20} {'':>6} {'status':>6} {'bytes':>8} {'server ms':>10} {'load ms':>9}")
+    for name, before_client, after_client, method, path, before_headers, after_headers, body in cases:
+        for label, client, headers in (("before", before_client, before_headers), ("after", after_client, after_headers)):
+            server_ms, size, status = measure(client, method, path, args.requests, headers, body)
+            transfer_ms = size * 8 / args.link_kbps
+            print(f"{name:<20} {label:>6} {status:>6} {size:>8} {server_ms:>10.3f} "
+                  f"{server_ms + args.rtt_ms + transfer_ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Throughput and per-worker memory of the pre-forked server.
+
+Starts the fault stub as a fast fake Azure and seeds a temporary Chroma store
+for web_app, either from data/*.pdf (embedded through the stub) or from
+--chunks synthetic vectors. Then runs gunicorn with 1, 2, 4... workers and
+hammers /chat from concurrent clients. For each worker count it reports
+requests/second and each worker's RSS, USS (private) and PSS (proportional,
+with shared pages split between processes), next to the shared index size.
+
+    python bench_prefork.py --workers 1 2 4 8 --duration 15 --clients 32
+    python bench_prefork.py --chunks 20000
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import numpy as np
+import psutil
+
+import web_app
+from shared_index import SharedIndex
+
+STUB_PORT = 8089
+APP_PORT = 5055
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SYNTHETIC_WORDS = ("harassment stalking court order offence person conduct protection victim "
+                   "abuse police evidence section notice application hearing").split()
+
+
+def wait_for(url, process=None, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{url}: server exited with status {process.returncode} before coming up")
+        try:
+            urllib.request.urlopen(url, timeout=2)
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def post_chat(message):
+    body = json.dumps({"message": message}).encode("utf-8")
+    req = urllib.request.Request(f"http://127.0.0.1:{APP_PORT}/chat", body,
+                                 {"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=30) as response:
+        return json.loads(response.read())
+
+
+def run_load(duration, clients):
+    """Return (full answers per second, failures) over the run.
+
+    Errors and degraded answers are failures; a client stops at its first one
+    so a broken server can't be mistaken for a slow one.
+    """
+    stop = time.monotonic() + duration
+    counts = [0] * clients
+    failures = []
+
+    def client(n):
+        while time.monotonic() < stop:
+            try:
+                answer = post_chat(f"What does the Act say about harassment? ({n})")
+            except Exception as e:
+                failures.append(repr(e))
+                return
+            if answer.get("degraded"):
+                failures.append("degraded answer")
+                return
+            counts[n] += 1
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(counts) / duration, failures
+
+
+def worker_memory(master):
+    """(rss, uss, pss) in MB for each worker process"""
+    results = []
+    for child in psutil.Process(master.pid).children():
+        info = child.memory_full_info()
+        results.append((info.rss / 1e6, info.uss / 1e6, getattr(info, "pss", 0) / 1e6))
+    return results
+
+
+def seed_from_pdfs(persist_directory):
+    """Embed data/*.pdf through the stub, split the same way as web_app"""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_community.vectorstores import Chroma
+    from langchain_openai import AzureOpenAIEmbeddings
+
+    documents = []
+    for path in sorted(glob.glob(os.path.join(REPO_DIR, os.path.dirname(web_app.PDF_PATH), "*.pdf"))):
+        documents.extend(PyPDFLoader(path).load())
+    chunks = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100).split_documents(documents)
+    embeddings = AzureOpenAIEmbeddings(azure_endpoint=f"http://127.0.0.1:{STUB_PORT}/", api_key="stub",
+                                       api_version="2024-08-01-preview", azure_deployment="text-embedding-ada-002",
+                                       check_embedding_ctx_length=False)
+    Chroma.from_documents(chunks, embeddings, persist_directory=persist_directory,
+                          collection_name=web_app.COLLECTION_NAME)
+
+
+def seed_synthetic(persist_directory, count, dimensions=1536, batch=2000):
+    """Random unit vectors and ~1000-character texts, for sizing beyond the corpus"""
+    import chromadb
+
+    rng = np.random.default_rng(0)
+    collection = chromadb.PersistentClient(path=persist_directory).create_collection(web_app.COLLECTION_NAME)
+    for start in range(0, count, batch):
+        n = min(batch, count - start)
+        vectors = rng.normal(size=(n, dimensions)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        texts = [" ".join(rng.choice(SYNTHETIC_WORDS, size=120)) for _ in range(n)]
+        collection.add(ids=[str(start + i) for i in range(n)], embeddings=vectors, documents=texts,
+                       metadatas=[{"source_file": "synthetic", "page": start + i} for i in range(n)])
+
+
+def bench(workers, duration, clients, workdir):
+    env = dict(os.environ,
+               AZURE_API_BASE=f"http://127.0.0.1:{STUB_PORT}/",
+               AZURE_API_KEY="stub",
+               SELENE_WORKERS=str(workers),
+               SELENE_BIND=f"127.0.0.1:{APP_PORT}")
+    # Run from workdir so web_app's relative chroma_db is the seeded store
+    master = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", os.path.join(REPO_DIR, "gunicorn.conf.py"),
+                               "--chdir", workdir, "--pythonpath", REPO_DIR,
+                               "--log-level", "warning", "web_app:app"],
+                              env=env, stdout=subprocess.DEVNULL)
+    try:
+        wait_for(f"http://127.0.0.1:{APP_PORT}/", master)
+        for seconds in (2, duration):  # the first run warms up every worker
+            throughput, failures = run_load(seconds, clients)
+            if failures:
+                raise RuntimeError(f"{workers} workers: {len(failures)} failed requests, e.g. {failures[:3]}")
+        memory = worker_memory(master)
+    finally:
+        master.terminate()
+        master.wait()
+    return throughput, memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count()])
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--stub-processes", type=int, default=os.cpu_count(),
+                        help="fake Azure processes, so the stub isn't what limits scaling")
+    parser.add_argument("--chunks", type=int, default=0,
+                        help="seed this many synthetic chunks instead of embedding data/*.pdf")
+    args = parser.parse_args()
+
+    stub = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, "fault_stub_server.py"),
+                             "--port", str(STUB_PORT), "--latency", "0.01", "--processes", str(args.stub_processes)],
+                            stdout=subprocess.DEVNULL)
+    try:
+        wait_for(f"http://127.0.0.1:{STUB_PORT}/_faults", stub)
+        with tempfile.TemporaryDirectory() as workdir:
+            persist_directory = os.path.join(workdir, web_app.CHROMA_DB_PATH)
+            if args.chunks:
+                seed_synthetic(persist_directory, args.chunks)
+            else:
+                seed_from_pdfs(persist_directory)
+            index = SharedIndex.snapshot(persist_directory, web_app.COLLECTION_NAME)
+            index_mb = index.nbytes / 1e6
+            print(f"Shared index: {len(index)} chunks, {index_mb:.1f} MB")
+            del index
+
+            print(f"{'workers':>7} {'req/s':>8} {'scaling':>8} {'index MB':>9} "
+                  f"{'RSS MB':>8} {'USS MB':>8} {'PSS MB':>8}")
+            baseline = None
+            for workers in sorted(set(args.workers)):
+                throughput, memory = bench(workers, args.duration, args.clients, workdir)
+                baseline = baseline or throughput
+                n = max(len(memory), 1)
+                rss, uss, pss = (sum(m[i] for m in memory) / n for i in range(3))
+                print(f"{workers:>7} {throughput:>8.1f} {throughput / baseline:>7.2f}x {index_mb:>9.1f} "
+                      f"{rss:>8.1f} {uss:>8.1f} {pss:>8.1f}")
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Local stand-in for the Azure OpenAI endpoints with fault injection.
+
+Point the app at it to exercise timeouts, hedging and circuit breaking:
+
+    python fault_stub_server.py --port 8089 --slow-rate 0.1 --slow-delay 30 --error-rate 0.2
+    AZURE_API_BASE=http://localhost:8089/ AZURE_API_KEY=stub python selene_bot.py
+
+Faults can also be changed at runtime without restarting:
+
+    curl -X POST localhost:8089/_faults -d '{"error_rate": 1.0}'
+
+test_resilience.py drives the same stub in-process to check deadlines,
+hedging, the breaker and the degraded answer.
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBEDDING_DIMENSIONS = 1536
+
+faults = {
+    "latency": 0.05,     # baseline delay for every call
+    "slow_rate": 0.0,    # fraction of calls that take slow_delay instead
+    "slow_delay": 30.0,
+    "slow_every": 0,     # if set, every Nth call (1st, N+1th, ...) is slow
+    "error_rate": 0.0,   # fraction of calls that fail
+    "error_status": 500, # status returned by failing calls
+    "error_path": "",    # if set, only calls whose path contains this fail
+    "retry_after": 1.0,  # Retry-After seconds sent with 429s
+}
+faults_lock = threading.Lock()
+stats = {"requests": 0, "errors": 0, "slow": 0}
+
+
+def fake_embedding(text):
+    """Deterministic unit vector so identical text always embeds the same"""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vector = [rng.uniform(-1, 1) for _ in range(EMBEDDING_DIMENSIONS)]
+    norm = sum(v * v for v in vector) ** 0.5
+    return [v / norm for v in vector]
+
+
+@functools.lru_cache(maxsize=1024)
+def embedding_json(text):
+    """Encoded embedding, cached so the stub doesn't become the bottleneck"""
+    return json.dumps(fake_embedding(text))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        self._send_body(status, json.dumps(payload).encode("utf-8"), headers)
+
+    def _send_body(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path.startswith("/_faults"):
+            with faults_lock:
+                self._send_json(200, {"faults": faults, "stats": stats})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        payload = self._read_json()
+
+        if self.path.startswith("/_faults"):
+            with faults_lock:
+                faults.update({k: type(faults[k])(v) for k, v in payload.items() if k in faults})
+                self._send_json(200, {"faults": faults})
+            return
+
+        with faults_lock:
+            current = dict(faults)
+            stats["requests"] += 1
+            slow = random.random() < current["slow_rate"]
+            if current["slow_every"]:
+                slow = (stats["requests"] - 1) % int(current["slow_every"]) == 0
+            error = (random.random() < current["error_rate"]
+                     and current["error_path"] in self.path)
+            stats["slow"] += slow
+            stats["errors"] += error
+
+        time.sleep(current["slow_delay"] if slow else current["latency"])
+
+        if error:
+            status = int(current["error_status"])
+            headers = {"Retry-After": str(current["retry_after"])} if status == 429 else None
+            self._send_json(status, {"error": {"message": "injected fault", "type": "server_error"}}, headers)
+        elif "/embeddings" in self.path:
+            self._send_embeddings(payload)
+        elif "/chat/completions" in self.path:
+            self._send_chat(payload)
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def _send_embeddings(self, payload):
+        inputs = payload.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        # LangChain may send pre-tokenised input; embed its string form.
+        data = ", ".join(
+            f'{{"object": "embedding", "index": {i}, "embedding": {embedding_json(str(text))}}}'
+            for i, text in enumerate(inputs))
+        body = ('{"object": "list", "data": [' + data + '], "model": "text-embedding-ada-002", '
+                '"usage": {"prompt_tokens": 0, "total_tokens": 0}}')
+        self._send_body(200, body.encode("utf-8"))
+
+    def _send_chat(self, payload):
+        messages = payload.get("messages", [])
+        prompt = messages[-1]["content"] if messages else ""
+        self._send_json(200, {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "gpt-35-turbo",
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant",
+                            "content": f"[stub answer to a {len(prompt)}-character prompt]"},
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fault-injecting Azure OpenAI stub")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=faults["latency"])
+    parser.add_argument("--slow-rate", type=float, default=faults["slow_rate"])
+    parser.add_argument("--slow-delay", type=float, default=faults["slow_delay"])
+    parser.add_argument("--slow-every", type=int, default=faults["slow_every"])
+    parser.add_argument("--error-rate", type=float, default=faults["error_rate"])
+    parser.add_argument("--error-status", type=int, default=faults["error_status"])
+    parser.add_argument("--error-path", default=faults["error_path"])
+    parser.add_argument("--retry-after", type=float, default=faults["retry_after"])
+    parser.add_argument("--processes", type=int, default=1,
+                        help="serve from this many forked processes (faults and stats are then per process)")
+    args = parser.parse_args()
+
+    faults.update(latency=args.latency, slow_rate=args.slow_rate, slow_delay=args.slow_delay,
+                  slow_every=args.slow_every, error_rate=args.error_rate, error_status=args.error_status,
+                  error_path=args.error_path, retry_after=args.retry_after)
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), StubHandler)
+    server.daemon_threads = True
+    print(f"Fault stub listening on http://localhost:{args.port}/ with faults {faults}")
+
+    # Fork after binding so every process accepts on the same socket
+    children = []
+    for _ in range(args.processes - 1):
+        pid = os.fork()
+        if pid == 0:
+            children = None
+            break
+        children.append(pid)
+    if children is not None:
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping fault stub")
+    finally:
+        for pid in children or []:
+            os.kill(pid, signal.SIGTERM)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+# Production serving: gunicorn -c gunicorn.conf.py web_app:app
+#
+# The app and its retrieval index are loaded once in the master process
+# (preload_app) and shared copy-on-write with the forked workers. Each worker
+# opens its own Azure clients after the fork.
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv("SELENE_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("SELENE_WORKERS", multiprocessing.cpu_count()))
+# Requests mostly wait on Azure, so a few threads per worker keep cores busy
+worker_class = "gthread"
+threads = int(os.getenv("SELENE_THREADS", "4"))
+preload_app = True
+
+# Recycle workers gracefully so slow leaks can't build up; jitter stops
+# them all restarting at once.
+max_requests = int(os.getenv("SELENE_MAX_REQUESTS", "1000"))
+max_requests_jitter = max_requests // 10
+graceful_timeout = 30
+timeout = 60
+
+
+def when_ready(server):
+    import web_app
+    web_app.preload_shared_index()
+    # Move everything loaded so far out of the collector's view so that GC
+    # passes in workers don't write to (and un-share) the parent's pages.
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    import web_app
+    web_app.initialize_rag()
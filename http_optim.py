@@ -0,0 +1,109 @@
+import gzip
+import hashlib
+
+from flask import request, make_response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Dynamic responses smaller than this aren't worth the CPU or the header bytes
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_MIMETYPES = {"application/json", "text/html", "text/plain"}
+
+# Static content is compressed once, so spend the time; dynamic content is
+# compressed per request, so keep it cheap.
+STATIC_GZIP_LEVEL = 9
+STATIC_BROTLI_QUALITY = 11
+DYNAMIC_GZIP_LEVEL = 6
+DYNAMIC_BROTLI_QUALITY = 4
+
+
+def supported_encodings():
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def choose_encoding():
+    """Pick the best encoding the client accepts, or None for identity"""
+    best, best_quality = None, 0
+    for encoding in supported_encodings():
+        quality = request.accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data, encoding, static=False):
+    if encoding == "br":
+        return brotli.compress(data, quality=STATIC_BROTLI_QUALITY if static else DYNAMIC_BROTLI_QUALITY)
+    if encoding == "gzip":
+        # mtime=0 keeps the output (and so the ETag) stable across restarts
+        return gzip.compress(data, compresslevel=STATIC_GZIP_LEVEL if static else DYNAMIC_GZIP_LEVEL, mtime=0)
+    return data
+
+
+class PrecompressedPage:
+    """A static page rendered and compressed once, served with strong ETags.
+
+    Each encoding is a different representation, so each gets its own ETag
+    hashed from the exact bytes sent; a compressor upgrade that changes the
+    output changes the ETag too.
+    """
+
+    def __init__(self, html, mimetype="text/html"):
+        self.mimetype = mimetype
+        body = html.encode("utf-8")
+        self.variants = {None: (body, _etag(body))}
+        for encoding in supported_encodings():
+            data = compress(body, encoding, static=True)
+            self.variants[encoding] = (data, _etag(data))
+
+    def response(self):
+        encoding = choose_encoding()
+        body, etag = self.variants[encoding]
+
+        if request.if_none_match.contains_weak(etag):
+            response = make_response("", 304)
+        else:
+            response = make_response(body)
+            response.mimetype = self.mimetype
+            if encoding:
+                response.content_encoding = encoding
+
+        response.set_etag(etag)
+        response.vary.add("Accept-Encoding")
+        # Cache, but revalidate every time so a deploy is picked up at once
+        response.cache_control.no_cache = True
+        return response
+
+
+def _etag(data):
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def compress_response(response):
+    """after_request hook: compress large dynamic responses"""
+    if (response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.content_encoding = encoding
+    return response
+
+
+def init_http_optimisation(app):
+    app.after_request(compress_response)
@@ -0,0 +1,376 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.error import HTTPError, URLError
+
+from langchain_core.documents import Document
+
+# Per-stage deadlines (seconds). A stage that overruns is treated as a failure.
+# Each stage's Azure client also gets its deadline as its HTTP timeout. That
+# bounds each phase of an attempt (connect, write, each read), not the whole
+# attempt, so a response that trickles in can keep a pool thread busy past the
+# deadline; the stage itself still returns on time and cancels queued attempts.
+RETRIEVAL_DEADLINE = float(os.getenv("SELENE_RETRIEVAL_DEADLINE", "5"))
+GENERATION_DEADLINE = float(os.getenv("SELENE_GENERATION_DEADLINE", "20"))
+CLIENT_MAX_RETRIES = int(os.getenv("SELENE_CLIENT_MAX_RETRIES", "0"))
+
+# Hedging: fire a duplicate request once the first has been outstanding for
+# longer than this percentile of recently observed latencies.
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_DELAY = {"retrieval": 1.0, "generation": 8.0}
+STAGE_MAX_WORKERS = 8
+
+# Throttling (429): stop calling the stage for Retry-After seconds (or this
+# default), capped so a bad header can't silence a stage for long.
+THROTTLE_DEFAULT = 1.0
+THROTTLE_MAX = 60.0
+
+# Circuit breaker: open after this many consecutive failures, then allow a
+# single trial call once the cool-down has passed.
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30.0
+
+SUPPORT_CONTACTS = """- Emergency: 999
+- Police (non-emergency): 101
+- National Domestic Violence Helpline: 0808 2000 247 (free, 24/7)
+- Rape Crisis England & Wales: 0808 802 9999
+- British Transport Police: text 61016
+- Victim Support: 0808 168 9111
+- Samaritans: 116 123"""
+
+EXCERPT_LENGTH = 400
+EXCERPT_COUNT = 3
+
+# Keyword fallback used when the embeddings upstream is down
+KEYWORD_LIMIT = 5
+KEYWORD_CANDIDATES = 200
+STOPWORDS = {
+    "about", "after", "also", "been", "does", "from", "have", "into", "just", "know",
+    "like", "make", "more", "need", "only", "said", "should", "some", "that", "them",
+    "then", "there", "they", "this", "want", "what", "when", "where", "which", "while",
+    "will", "with", "would", "your",
+}
+
+# Errors that say nothing about the request itself: the upstream is slow,
+# unreachable or failing. Only these are hedged and count against the
+# breaker. Throttling (429) is handled separately, and anything else (bad
+# request, content filter, auth, local bugs) goes straight back to the caller.
+TRANSIENT_ERRORS = (TimeoutError, ConnectionError, URLError)
+try:
+    import openai
+    TRANSIENT_ERRORS += (openai.APIConnectionError,)
+except ImportError:
+    pass
+try:
+    import httpx
+    TRANSIENT_ERRORS += (httpx.TransportError,)
+except ImportError:
+    pass
+
+
+def _status(error):
+    status = getattr(error, "status_code", None)
+    if status is None and isinstance(error, HTTPError):
+        status = error.code
+    return status
+
+
+def is_transient(error):
+    status = _status(error)
+    if status is not None:
+        return status >= 500
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def retry_after(error):
+    """Seconds to back off for a 429, or None if this isn't throttling"""
+    if _status(error) != 429:
+        return None
+    headers = getattr(getattr(error, "response", None), "headers", None) or getattr(error, "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return min(THROTTLE_MAX, max(0.0, float(headers.get(name)) * scale))
+        except (TypeError, ValueError):
+            continue
+    return THROTTLE_DEFAULT
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when a stage misses its deadline, is throttled or its circuit is open"""
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies"""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * pct / 100))
+        return samples[index]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open trial -> closed"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def allow(self):
+        """Return True if a call may go upstream right now"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def release(self):
+        """End a call that says nothing about upstream health"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                print(f"Circuit '{self.name}' closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    print(f"Circuit '{self.name}' opened after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class ResilientStage:
+    """Run one upstream call with a deadline, hedging and a circuit breaker"""
+
+    def __init__(self, name, deadline, breaker=None, hedge=True, max_workers=STAGE_MAX_WORKERS):
+        self.name = name
+        self.deadline = deadline
+        self.breaker = breaker or CircuitBreaker(name)
+        self.hedge = hedge
+        self.latency = LatencyTracker()
+        self._throttled_until = 0.0
+        # One pool per stage, so a brownout in one upstream can't starve the other
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"selene-{name}")
+
+    def hedge_delay(self):
+        if len(self.latency) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY.get(self.name, self.deadline / 2)
+        return self.latency.percentile(HEDGE_PERCENTILE)
+
+    def _timed(self, fn, *args):
+        start = time.monotonic()
+        result = fn(*args)
+        self.latency.record(time.monotonic() - start)
+        return result
+
+    def call(self, fn, *args):
+        if time.monotonic() < self._throttled_until:
+            raise UpstreamUnavailable(f"{self.name}: throttled")
+        if not self.breaker.allow():
+            raise UpstreamUnavailable(f"{self.name}: circuit open")
+
+        start = time.monotonic()
+        end = start + self.deadline
+        pending = {self._executor.submit(self._timed, fn, *args)}
+        hedged = not self.hedge
+        last_error = None
+
+        try:
+            while pending:
+                now = time.monotonic()
+                if now >= end:
+                    break
+                timeout = end - now
+                if not hedged:
+                    timeout = min(timeout, max(0.0, start + self.hedge_delay() - now))
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        backoff = retry_after(e)
+                        if backoff is not None:
+                            # Throttled: a duplicate would only add load, and
+                            # the upstream is healthy, so fail fast without
+                            # touching the breaker and honour Retry-After.
+                            self.breaker.release()
+                            self._throttled_until = time.monotonic() + backoff
+                            raise UpstreamUnavailable(f"{self.name}: throttled for {backoff}s") from e
+                        if not is_transient(e):
+                            self.breaker.release()
+                            raise
+                        last_error = e
+                        continue
+                    self.breaker.record_success()
+                    return result
+
+                if not hedged and time.monotonic() < end:
+                    # Primary is slow (or failed transiently): send a duplicate.
+                    hedged = True
+                    pending.add(self._executor.submit(self._timed, fn, *args))
+        finally:
+            # Drop attempts still queued behind a busy pool; running ones end
+            # at the latest when their client timeout fires.
+            for future in pending:
+                future.cancel()
+
+        self.breaker.record_failure()
+        if last_error is not None and not pending:
+            raise UpstreamUnavailable(f"{self.name}: {last_error}") from last_error
+        raise UpstreamUnavailable(f"{self.name}: deadline of {self.deadline}s exceeded")
+
+
+def keywords(question, limit=KEYWORD_LIMIT):
+    """The longest distinct non-trivial words in a question"""
+    words = dict.fromkeys(re.findall(r"[a-z]+", question.lower()))
+    terms = [w for w in words if len(w) > 3 and w not in STOPWORDS]
+    return sorted(terms, key=len, reverse=True)[:limit]
+
+
+def rank_by_keywords(documents, question, k=EXCERPT_COUNT):
+    """Top k documents by keyword hits, ignoring those with none"""
+    terms = keywords(question)
+    scored = []
+    for doc in documents:
+        text = doc.page_content.lower()
+        score = sum(text.count(term) for term in terms)
+        if score:
+            scored.append((score, doc))
+    scored.sort(key=lambda pair: pair[0], reverse=True)
+    return [doc for _, doc in scored[:k]]
+
+
+def chroma_keyword_search(vector_store, question, k=EXCERPT_COUNT):
+    """Fallback retrieval over Chroma's local full-text index; no embedding call"""
+    terms = keywords(question)
+    if not terms:
+        return []
+    # $contains is case-sensitive, so match lower-case and capitalised forms
+    clauses = [{"$contains": form} for term in terms for form in (term, term.capitalize())]
+    data = vector_store.get(where_document={"$or": clauses}, include=["documents", "metadatas"],
+                            limit=KEYWORD_CANDIDATES)
+    documents = [Document(page_content=text, metadata=metadata or {})
+                 for text, metadata in zip(data["documents"], data["metadatas"])]
+    return rank_by_keywords(documents, question, k)
+
+
+def format_degraded_answer(documents):
+    """Build a fallback answer from retrieved excerpts and support contacts"""
+    parts = ["I'm really sorry, I'm having trouble putting together a full answer right now. "
+             "You're not alone, and help is available."]
+
+    if documents:
+        parts.append("Here are the most relevant parts of the law I found for your question:")
+        for doc in documents:
+            source = doc.metadata.get("source_file") or os.path.basename(doc.metadata.get("source", ""))
+            page = doc.metadata.get("page")
+            label = f"{source}, page {page + 1}" if isinstance(page, int) else source
+            excerpt = " ".join(doc.page_content.split())
+            if len(excerpt) > EXCERPT_LENGTH:
+                excerpt = excerpt[:EXCERPT_LENGTH].rsplit(" ", 1)[0] + "..."
+            parts.append(f"[{label}] {excerpt}" if label else excerpt)
+
+    parts.append("If you need to talk to someone now, these services can help:\n" + SUPPORT_CONTACTS)
+    return "\n\n".join(parts)
+
+
+class ResilientRagChain:
+    """Drop-in for create_retrieval_chain with per-stage resilience.
+
+    Returns the same keys as the LangChain retrieval chain ("input", "context",
+    "answer") plus "degraded", which is True when the answer was built from
+    excerpts because an upstream stage failed. If retrieval itself is down,
+    excerpts come from fallback_search (question -> documents), which must not
+    need the embeddings upstream. Errors the breaker ignores, such as a
+    content-filter rejection, still get a degraded answer rather than an error,
+    so nobody who reached out is left with nothing.
+    """
+
+    def __init__(self, retriever, combine_docs_chain, fallback_search=None,
+                 retrieval_deadline=RETRIEVAL_DEADLINE,
+                 generation_deadline=GENERATION_DEADLINE):
+        self.retriever = retriever
+        self.combine_docs_chain = combine_docs_chain
+        self.fallback_search = fallback_search
+        self.retrieval = ResilientStage("retrieval", retrieval_deadline)
+        self.generation = ResilientStage("generation", generation_deadline)
+
+    def _fallback_documents(self, question):
+        if self.fallback_search is None:
+            return []
+        try:
+            return self.fallback_search(question)
+        except Exception as e:
+            print(f"Keyword fallback failed: {e}")
+            return []
+
+    def invoke(self, inputs):
+        question = inputs["input"]
+
+        try:
+            documents = self.retrieval.call(self.retriever.invoke, question)
+        except Exception as e:
+            print(f"Retrieval failed, serving degraded answer: {e!r}")
+            documents = self._fallback_documents(question)
+            return {"input": question, "context": documents,
+                    "answer": format_degraded_answer(documents), "degraded": True}
+
+        try:
+            answer = self.generation.call(
+                self.combine_docs_chain.invoke, {"input": question, "context": documents})
+        except Exception as e:
+            print(f"Generation failed, serving degraded answer: {e!r}")
+            return {"input": question, "context": documents,
+                    "answer": format_degraded_answer(documents), "degraded": True}
+
+        return {"input": question, "context": documents, "answer": answer, "degraded": False}
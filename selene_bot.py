@@ -5,9 +5,10 @@ from langchain_openai import AzureOpenAIEmbeddings
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_openai import AzureChatOpenAI
-from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain.prompts import ChatPromptTemplate
+from resilience import (ResilientRagChain, chroma_keyword_search,
+                        RETRIEVAL_DEADLINE, GENERATION_DEADLINE, CLIENT_MAX_RETRIES)
 
 # Load environment variables from .env file
 load_dotenv()
@@ -22,13 +23,17 @@ DATA_DIR = "data"
 CHROMA_DB_PATH = "chroma_db"
 COLLECTION_NAME = "vawg_documents"
 
-def setup_embeddings():
-    """Initialize embeddings object"""
+def setup_embeddings(timeout=RETRIEVAL_DEADLINE, max_retries=CLIENT_MAX_RETRIES):
+    """Initialize embeddings object (None for timeout/max_retries means the SDK default, for bulk ingestion)"""
+    # The client rejects max_retries=None, so leave it out to get the SDK default
+    retries = {} if max_retries is None else {"max_retries": max_retries}
     return AzureOpenAIEmbeddings(
         azure_endpoint=azure_endpoint,
         api_key=api_key,
         api_version=api_version,
-        azure_deployment="text-embedding-ada-002"
+        azure_deployment="text-embedding-ada-002",
+        timeout=timeout,
+        **retries
     )
 
 def create_vector_store():
@@ -72,7 +77,7 @@ def create_vector_store():
     print(f"Split into {len(chunks)} chunks")
 
     # Create embeddings
-    embeddings = setup_embeddings()
+    embeddings = setup_embeddings(timeout=None, max_retries=None)
     
     # Create ChromaDB vector store
     print("Creating embeddings and storing in ChromaDB... (This costs money)")
@@ -127,7 +132,9 @@ def setup_rag_chain(vector_store):
         api_key=api_key,
         api_version=api_version,
         azure_deployment="gpt-35-turbo",
-        temperature=0.1
+        temperature=0.1,
+        timeout=GENERATION_DEADLINE,
+        max_retries=CLIENT_MAX_RETRIES
     )
 
     # Create prompt template
@@ -177,7 +184,10 @@ Respond naturally and conversationally to help this person:
     
     # Create chains
     combine_docs_chain = create_stuff_documents_chain(llm, prompt)
-    rag_chain = create_retrieval_chain(retriever, combine_docs_chain)
+    rag_chain = ResilientRagChain(
+        retriever, combine_docs_chain,
+        fallback_search=lambda question: chroma_keyword_search(vector_store, question)
+    )
     
     return rag_chain
 
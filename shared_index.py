@@ -0,0 +1,148 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from typing import Any, List
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from resilience import keywords
+
+
+class SharedIndex:
+    """Read-only, fork-friendly copy of a Chroma collection.
+
+    Built once in the parent process before workers are forked. Everything
+    lives in a handful of large buffers (one float32 matrix, bytes blobs for
+    chunk texts and their lower-cased copy, one for metadata) rather than thousands of small Python
+    objects, so reading it in a worker doesn't touch refcounts on shared
+    pages and the memory stays shared copy-on-write.
+    """
+
+    def __init__(self, embeddings, texts, metadatas):
+        if embeddings is None or len(embeddings) == 0:
+            # Empty collection: keep a 2-D shape so the maths below still works
+            embeddings = np.empty((0, 0), dtype=np.float32)
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.text_blob, self.text_offsets = _pack([t.encode("utf-8") for t in texts])
+        self.meta_blob, self.meta_offsets = _pack([json.dumps(m or {}).encode("utf-8") for m in metadatas])
+        self._freeze()
+
+    def _freeze(self):
+        self.norms = np.einsum("ij,ij->i", self.embeddings, self.embeddings)
+        # Keywords are ASCII, so bytes.lower() is enough for case-insensitive matching
+        self.lower_blob = self.text_blob.lower()
+        for array in (self.embeddings, self.norms, self.text_offsets, self.meta_offsets):
+            array.setflags(write=False)
+
+    @classmethod
+    def from_vector_store(cls, vector_store):
+        """Snapshot every chunk and embedding out of a LangChain Chroma store or Chroma collection"""
+        data = vector_store.get(include=["embeddings", "documents", "metadatas"])
+        return cls(data["embeddings"], data["documents"], data["metadatas"])
+
+    @classmethod
+    def snapshot(cls, persist_directory, collection_name):
+        """Load a persisted collection without opening Chroma in this process.
+
+        Chroma's client starts runtime threads that outlive it and keeps a
+        sqlite handle open; a process that forks workers must stay clear of
+        both. A short-lived subprocess reads the collection and hands back
+        the packed buffers through a temporary file.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.npz")
+            subprocess.run([sys.executable, os.path.abspath(__file__), persist_directory, collection_name, path],
+                           check=True)
+            return cls.load(path)
+
+    def save(self, path):
+        np.savez(path, embeddings=self.embeddings,
+                 text_blob=np.frombuffer(self.text_blob, dtype=np.uint8), text_offsets=self.text_offsets,
+                 meta_blob=np.frombuffer(self.meta_blob, dtype=np.uint8), meta_offsets=self.meta_offsets)
+
+    @classmethod
+    def load(cls, path):
+        index = cls.__new__(cls)
+        with np.load(path) as data:
+            index.embeddings = data["embeddings"]
+            index.text_blob = data["text_blob"].tobytes()
+            index.text_offsets = data["text_offsets"]
+            index.meta_blob = data["meta_blob"].tobytes()
+            index.meta_offsets = data["meta_offsets"]
+        index._freeze()
+        return index
+
+    def __len__(self):
+        return len(self.text_offsets) - 1
+
+    @property
+    def nbytes(self):
+        return (self.embeddings.nbytes + self.norms.nbytes + len(self.text_blob) + len(self.lower_blob)
+                + len(self.meta_blob) + self.text_offsets.nbytes + self.meta_offsets.nbytes)
+
+    def document(self, i):
+        text = self.text_blob[self.text_offsets[i]:self.text_offsets[i + 1]].decode("utf-8")
+        metadata = json.loads(self.meta_blob[self.meta_offsets[i]:self.meta_offsets[i + 1]])
+        return Document(page_content=text, metadata=metadata)
+
+    def keyword_search(self, question, k=3):
+        """Embedding-free fallback: rank chunks by keyword hits.
+
+        Scores come from scanning the whole text blob at once; only the
+        top k chunks are decoded into Documents.
+        """
+        terms = keywords(question)
+        if not terms or len(self) == 0:
+            return []
+        scores = np.zeros(len(self), dtype=np.int64)
+        for term in terms:
+            positions = [m.start() for m in re.finditer(re.escape(term.encode("ascii")), self.lower_blob)]
+            if positions:
+                chunks = np.searchsorted(self.text_offsets, positions, side="right") - 1
+                scores += np.bincount(chunks, minlength=len(self))
+        top = np.argsort(-scores, kind="stable")[:k]
+        return [self.document(i) for i in top if scores[i] > 0]
+
+    def search(self, query_embedding, k=3):
+        """Return the k nearest chunks by L2 distance (same space as the Chroma collection)"""
+        if len(self) == 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        distances = self.norms - 2 * (self.embeddings @ query) + query @ query
+        k = min(k, len(distances))
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+        return [self.document(i) for i in nearest]
+
+
+class SharedIndexRetriever(BaseRetriever):
+    """Retriever over a SharedIndex; only the query embedding goes upstream"""
+
+    index: Any
+    embeddings: Any
+    k: int = 3
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.index.search(self.embeddings.embed_query(query), k=self.k)
+
+
+def _pack(items):
+    offsets = np.zeros(len(items) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in items], out=offsets[1:])
+    return b"".join(items), offsets
+
+
+if __name__ == "__main__":
+    # Worker side of SharedIndex.snapshot: <persist_directory> <collection_name> <output.npz>
+    import chromadb
+
+    persist_directory, collection_name, output = sys.argv[1:]
+    collection = chromadb.PersistentClient(path=persist_directory).get_or_create_collection(collection_name)
+    SharedIndex.from_vector_store(collection).save(output)
@@ -0,0 +1,53 @@
+import gzip
+import hashlib
+
+from flask import Flask, jsonify
+
+import http_optim
+from http_optim import PrecompressedPage, init_http_optimisation
+
+PAGE = "<html>" + "Support is available. " * 500 + "</html>"
+
+
+def make_client():
+    app = Flask(__name__)
+    init_http_optimisation(app)
+    page = PrecompressedPage(PAGE)
+    app.add_url_rule("/", "home", page.response)
+    app.add_url_rule("/big", "big", lambda: jsonify(response="x " * 2000), methods=["POST"])
+    app.add_url_rule("/small", "small", lambda: jsonify(response="hi"), methods=["POST"])
+    return app.test_client()
+
+
+def test_each_variant_etag_hashes_its_own_bytes():
+    client = make_client()
+    etags = set()
+    for encoding in [None] + http_optim.supported_encodings():
+        headers = {"Accept-Encoding": encoding} if encoding else {}
+        response = client.get("/", headers=headers)
+        assert response.headers.get("Content-Encoding") == encoding
+        etag = response.get_etag()[0]
+        assert etag == hashlib.sha256(response.data).hexdigest()[:32]
+        etags.add(etag)
+    assert len(etags) == 1 + len(http_optim.supported_encodings())
+
+
+def test_conditional_request_gets_304():
+    client = make_client()
+    first = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert gzip.decompress(first.data).decode() == PAGE
+    again = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304 and again.data == b""
+    # The identity representation doesn't match the gzip ETag
+    plain = client.get("/", headers={"If-None-Match": first.headers["ETag"]})
+    assert plain.status_code == 200 and plain.data.decode() == PAGE
+
+
+def test_api_responses_compressed_above_threshold():
+    client = make_client()
+    big = client.post("/big", headers={"Accept-Encoding": "gzip"})
+    assert big.headers["Content-Encoding"] == "gzip"
+    assert int(big.headers["Content-Length"]) == len(big.data)
+    small = client.post("/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in small.headers
+    assert small.headers["Vary"] == "Accept-Encoding"
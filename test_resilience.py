@@ -0,0 +1,144 @@
+"""Resilience layer against the fault-injecting stub, using the real Azure clients."""
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain.prompts import ChatPromptTemplate
+from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
+
+import fault_stub_server as stub
+import resilience
+from resilience import CircuitBreaker, ResilientRagChain
+from shared_index import SharedIndex, SharedIndexRetriever
+
+DEADLINE = 1.0
+HEDGE_DELAY = 0.2
+SLOW = 3.0
+
+CHUNKS = [
+    "Harassment: a person must not pursue a course of conduct which amounts to harassment of another.",
+    "A person guilty of an offence under section 4 is liable to imprisonment.",
+    "The court may make a non-molestation order prohibiting a person from molesting another.",
+]
+
+
+@pytest.fixture
+def stub_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), stub.StubHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    saved = dict(stub.faults)
+    stub.faults.update(latency=0.01, slow_rate=0.0, slow_delay=SLOW, slow_every=0,
+                       error_rate=0.0, error_status=500, error_path="", retry_after=1.0)
+    stub.stats.update(requests=0, errors=0, slow=0)
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    stub.faults.update(saved)
+
+
+@pytest.fixture
+def chain(stub_url, monkeypatch):
+    monkeypatch.setitem(resilience.HEDGE_DEFAULT_DELAY, "retrieval", HEDGE_DELAY)
+    monkeypatch.setitem(resilience.HEDGE_DEFAULT_DELAY, "generation", HEDGE_DELAY)
+    client = dict(azure_endpoint=stub_url, api_key="stub", api_version="2024-08-01-preview",
+                  timeout=DEADLINE, max_retries=0)
+    embeddings = AzureOpenAIEmbeddings(azure_deployment="text-embedding-ada-002",
+                                       check_embedding_ctx_length=False, **client)
+    llm = AzureChatOpenAI(azure_deployment="gpt-35-turbo", **client)
+    index = SharedIndex([stub.fake_embedding(c) for c in CHUNKS], CHUNKS,
+                        [{"source_file": "Protection_from_Harassment_Act_1997.pdf", "page": i} for i in range(3)])
+    prompt = ChatPromptTemplate.from_template("{context}\n\n{input}")
+    return ResilientRagChain(SharedIndexRetriever(index=index, embeddings=embeddings, k=2),
+                             create_stuff_documents_chain(llm, prompt),
+                             fallback_search=index.keyword_search,
+                             retrieval_deadline=DEADLINE, generation_deadline=DEADLINE)
+
+
+def timed_invoke(chain, question="What counts as harassment?"):
+    start = time.monotonic()
+    response = chain.invoke({"input": question})
+    return response, time.monotonic() - start
+
+
+def test_healthy_upstream_answers_without_hedging(chain):
+    response, _ = timed_invoke(chain)
+    assert not response["degraded"]
+    assert response["answer"].startswith("[stub answer")
+    assert stub.stats["requests"] == 2
+
+
+def test_slow_primary_is_hedged(chain):
+    stub.faults["slow_every"] = 2  # every primary is slow, every hedge is fast
+    response, elapsed = timed_invoke(chain)
+    assert not response["degraded"]
+    assert elapsed < DEADLINE
+    assert stub.stats["requests"] == 4
+
+
+def test_deadline_serves_excerpts_and_contacts(chain):
+    stub.faults["slow_rate"] = 1.0
+    response, elapsed = timed_invoke(chain)
+    assert response["degraded"]
+    assert elapsed < DEADLINE + 0.5
+    # Retrieval is down, so the excerpts come from the keyword fallback
+    assert "pursue a course of conduct" in response["answer"]
+    assert "0808 2000 247" in response["answer"]
+
+
+def test_content_filter_rejection_gets_excerpts_without_tripping_breaker(chain):
+    stub.faults.update(error_rate=1.0, error_status=400, error_path="/chat/completions")
+    calls = resilience.BREAKER_FAILURE_THRESHOLD + 1
+    for _ in range(calls):
+        response, _ = timed_invoke(chain)
+        assert response["degraded"]
+        # Retrieval worked, so the excerpts are the vector-search results
+        assert response["context"]
+        assert "0808 2000 247" in response["answer"]
+    # One embedding and one chat request per call: the 400 was not hedged
+    assert stub.stats["requests"] == 2 * calls
+    assert chain.generation.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_throttling_is_not_hedged_and_honours_retry_after(chain):
+    stub.faults.update(error_rate=1.0, error_status=429, retry_after=0.3)
+    for _ in range(resilience.BREAKER_FAILURE_THRESHOLD + 1):
+        response, elapsed = timed_invoke(chain)
+        assert response["degraded"]
+        assert elapsed < HEDGE_DELAY
+    # Only the first call went upstream; the rest waited out Retry-After
+    assert stub.stats["requests"] == 1
+    assert chain.retrieval.breaker.state == CircuitBreaker.CLOSED
+
+    stub.faults["error_rate"] = 0.0
+    time.sleep(0.3)
+    assert not timed_invoke(chain)[0]["degraded"]
+
+
+def test_breaker_opens_fails_fast_and_recovers(chain):
+    breaker = chain.retrieval.breaker
+    breaker.reset_timeout = 0.3
+    stub.faults["error_rate"] = 1.0
+
+    for _ in range(breaker.failure_threshold):
+        assert timed_invoke(chain)[0]["degraded"]
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Open: no upstream call at all
+    seen = stub.stats["requests"]
+    response, elapsed = timed_invoke(chain)
+    assert response["degraded"] and elapsed < HEDGE_DELAY
+    assert stub.stats["requests"] == seen
+
+    # Half-open trial that fails re-opens the circuit
+    time.sleep(breaker.reset_timeout)
+    assert timed_invoke(chain)[0]["degraded"]
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Half-open trial that succeeds closes it
+    stub.faults["error_rate"] = 0.0
+    time.sleep(breaker.reset_timeout)
+    assert not timed_invoke(chain)[0]["degraded"]
+    assert breaker.state == CircuitBreaker.CLOSED
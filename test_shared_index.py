@@ -0,0 +1,82 @@
+import numpy as np
+from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import FakeEmbeddings
+
+from shared_index import SharedIndex
+
+
+def test_empty_collection():
+    store = Chroma(collection_name="empty_test", embedding_function=FakeEmbeddings(size=8))
+    index = SharedIndex.from_vector_store(store)
+    assert len(index) == 0
+    assert index.search([0.1] * 8) == []
+    assert index.keyword_search("harassment") == []
+
+
+def test_none_embeddings():
+    index = SharedIndex(None, [], [])
+    assert len(index) == 0
+    assert index.search([0.0, 1.0]) == []
+
+
+def test_search_matches_brute_force_l2():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(50, 16)).astype(np.float32)
+    texts = [f"chunk {i}" for i in range(50)]
+    index = SharedIndex(vectors, texts, [{"page": i} for i in range(50)])
+
+    for _ in range(10):
+        query = rng.normal(size=16).astype(np.float32)
+        expected = np.argsort(np.linalg.norm(vectors - query, axis=1))[:5]
+        results = index.search(query, k=5)
+        assert [doc.metadata["page"] for doc in results] == list(expected)
+        assert [doc.page_content for doc in results] == [texts[i] for i in expected]
+
+
+def test_search_k_larger_than_index():
+    index = SharedIndex([[0.0, 0.0], [1.0, 1.0]], ["near", "far"], [None, {"page": 1}])
+    results = index.search([0.1, 0.1], k=5)
+    assert [doc.page_content for doc in results] == ["near", "far"]
+    assert results[0].metadata == {}
+
+
+def test_snapshot_round_trips_through_subprocess(tmp_path):
+    import chromadb
+
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(20, 8)).astype(np.float32)
+    collection = chromadb.PersistentClient(path=str(tmp_path)).create_collection("snapshot_test")
+    collection.add(ids=[str(i) for i in range(20)], embeddings=vectors.tolist(),
+                   documents=[f"chunk {i}" for i in range(20)], metadatas=[{"page": i} for i in range(20)])
+
+    direct = SharedIndex.from_vector_store(collection)
+    snapshot = SharedIndex.snapshot(str(tmp_path), "snapshot_test")
+    assert len(snapshot) == 20
+    assert snapshot.nbytes == direct.nbytes
+    for i in range(20):
+        assert snapshot.document(i) == direct.document(i)
+    query = rng.normal(size=8)
+    assert snapshot.search(query, k=4) == direct.search(query, k=4)
+
+
+def test_snapshot_of_missing_collection_is_empty(tmp_path):
+    index = SharedIndex.snapshot(str(tmp_path), "missing_collection")
+    assert len(index) == 0
+    assert index.search([0.0] * 4) == []
+
+
+def test_keyword_search_matches_per_document_ranking():
+    from resilience import rank_by_keywords
+
+    texts = [
+        "Harassment of a person is an offence.",
+        "Stalking involving fear of violence or serious alarm; stalking is harassment.",
+        "A non-molestation order may be made by the court.",
+        "HARASSMENT, stalking and HARASSMENT again.",
+        "Nothing relevant here at all.",
+    ]
+    index = SharedIndex(np.zeros((5, 2)), texts, [{"page": i} for i in range(5)])
+    for question in ["What counts as harassment and stalking?", "Can the court make an order?",
+                     "violence", "hello"]:
+        documents = [index.document(i) for i in range(len(index))]
+        assert index.keyword_search(question, k=3) == rank_by_keywords(documents, question, k=3)
@@ -7,15 +7,19 @@ from langchain_openai import AzureOpenAIEmbeddings
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_openai import AzureChatOpenAI
-from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain.prompts import ChatPromptTemplate
+from resilience import (ResilientRagChain, chroma_keyword_search,
+                        RETRIEVAL_DEADLINE, GENERATION_DEADLINE, CLIENT_MAX_RETRIES)
+from shared_index import SharedIndex, SharedIndexRetriever
+from http_optim import PrecompressedPage, init_http_optimisation
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)
+init_http_optimisation(app)
 
 # Your existing configuration
 azure_endpoint = os.getenv("AZURE_API_BASE")
@@ -29,13 +33,24 @@ COLLECTION_NAME = "sexual_offences_act"
 # Global variable for the RAG chain
 rag_chain = None
 
+# Read-only index loaded by the parent process in pre-forked serving mode
+shared_index = None
+
 # Your existing functions (copied from your original code)
-def setup_embeddings():
+def setup_embeddings(timeout=RETRIEVAL_DEADLINE, max_retries=CLIENT_MAX_RETRIES):
+    # The client rejects max_retries=None, so leave it out to get the SDK default
+    retries = {} if max_retries is None else {"max_retries": max_retries}
     return AzureOpenAIEmbeddings(
         azure_endpoint=azure_endpoint,
         api_key=api_key,
         api_version=api_version,
-        azure_deployment="text-embedding-ada-002"
+        azure_deployment="text-embedding-ada-002",
+        timeout=timeout,
+        # Chunks and questions are far below the model's token limit, so skip
+        # tiktoken splitting; otherwise each worker downloads the tokenizer
+        # from the public internet on its first query.
+        check_embedding_ctx_length=False,
+        **retries
     )
 
 def create_vector_store():
@@ -52,7 +67,7 @@ def create_vector_store():
     chunks = text_splitter.split_documents(documents)
     print(f"Split into {len(chunks)} chunks")
 
-    embeddings = setup_embeddings()
+    embeddings = setup_embeddings(timeout=None, max_retries=None)
     print("Creating embeddings and storing in ChromaDB...")
     vector_store = Chroma.from_documents(
         documents=chunks,
@@ -86,15 +101,19 @@ def setup_vector_store():
     else:
         return create_vector_store()
 
-def setup_rag_chain(vector_store):
-    retriever = vector_store.as_retriever(search_kwargs={"k": 3})
+def setup_rag_chain(vector_store=None, retriever=None, fallback_search=None):
+    if retriever is None:
+        retriever = vector_store.as_retriever(search_kwargs={"k": 3})
+        fallback_search = lambda question: chroma_keyword_search(vector_store, question)
 
     llm = AzureChatOpenAI(
         azure_endpoint=azure_endpoint,
         api_key=api_key,
         api_version=api_version,
         azure_deployment="gpt-35-turbo",
-        temperature=0.1
+        temperature=0.1,
+        timeout=GENERATION_DEADLINE,
+        max_retries=CLIENT_MAX_RETRIES
     )
 
     prompt = ChatPromptTemplate.from_template("""
@@ -109,22 +128,38 @@ Provide a clear and accurate answer based on the legal text provided. Be compass
 """)
 
     combine_docs_chain = create_stuff_documents_chain(llm, prompt)
-    rag_chain = create_retrieval_chain(retriever, combine_docs_chain)
+    rag_chain = ResilientRagChain(retriever, combine_docs_chain, fallback_search=fallback_search)
     return rag_chain
 
+def preload_shared_index():
+    """Load chunks and embeddings once so forked workers can share them"""
+    global shared_index
+    if shared_index is None:
+        print("Preloading shared index...")
+        # Read via a subprocess so this process never starts Chroma's threads:
+        # gunicorn forks every worker from here.
+        shared_index = SharedIndex.snapshot(CHROMA_DB_PATH, COLLECTION_NAME)
+        print(f"Shared index ready: {len(shared_index)} chunks, {shared_index.nbytes / 1e6:.1f} MB")
+
 def initialize_rag():
     global rag_chain
     if rag_chain is None:
         print("Initializing RAG system...")
-        vector_store = setup_vector_store()
-        rag_chain = setup_rag_chain(vector_store)
+        if shared_index is not None:
+            # Pre-forked worker: search the parent's index, but open our own
+            # HTTP clients since connections must not cross a fork.
+            retriever = SharedIndexRetriever(index=shared_index, embeddings=setup_embeddings(), k=3)
+            rag_chain = setup_rag_chain(retriever=retriever, fallback_search=shared_index.keyword_search)
+        else:
+            vector_store = setup_vector_store()
+            rag_chain = setup_rag_chain(vector_store)
         print("RAG system ready!")
 
 # Web routes
 @app.route('/')
 def home():
-    # This will serve our HTML page
-    return render_template_string(HTML_TEMPLATE)
+    # Served from the copy rendered and compressed once at startup
+    return home_page.response()
 
 @app.route('/chat', methods=['POST'])
 def chat():
@@ -138,6 +173,7 @@ def chat():
         
         return jsonify({
             "response": response['answer'],
+            "degraded": response.get('degraded', False),
             "status": "success"
         })
         
@@ -416,7 +452,12 @@ HTML_TEMPLATE = '''
 </html>
 '''
 
+# The page has no per-request content, so render and compress it once
+with app.app_context():
+    home_page = PrecompressedPage(render_template_string(HTML_TEMPLATE))
+
 if __name__ == '__main__':
     print("Starting Selene Web App...")
     print("Once running, open your browser and go to: http://localhost:5000")
+    print("For production, run: gunicorn -c gunicorn.conf.py web_app:app")
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file